@@ -1,9 +1,14 @@
 # myapp.py
 
+import asyncio
+import hashlib
+import queue
+import threading
+
 import streamlit as st
 import google.generativeai as genai
-from PyPDF2 import PdfReader
-from transformers import pipeline
+import pypdfium2 as pdfium
+import numpy as np
 LOGO_URL = "https://seeklogo.com/images/I/ignou-logo-03593C2B9B-seeklogo.com.png" # <--- Yahan apna actual image URL daalein
 
 
@@ -36,14 +41,49 @@ def load_gemini_model():
     """Loads the Gemini model."""
     return genai.GenerativeModel('gemini-1.5-flash-latest')
 
+@st.cache_resource
+def get_event_loop():
+    """Starts one asyncio event loop on a background thread for async Gemini calls."""
+    # Ek hi loop rakhein - Gemini ka async (grpc) client pehle wale loop se bandh jata hai
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+@st.cache_resource
+def get_pdfium_lock():
+    """Returns the process-wide lock that serializes all PDFium calls."""
+    # PDFium thread-safe nahi hai aur har session ka script alag thread par chalta hai
+    return threading.Lock()
+
 @st.cache_resource(show_spinner="Loading summarizer model...")
 def load_summarizer_pipeline():
-    """Loads the summarization model from HuggingFace."""
-    return pipeline("summarization", model="facebook/bart-large-cnn")
+    """Loads the summarization model from HuggingFace (fp16 on GPU, INT8 on CPU)."""
+    # torch/transformers bhaari hain - inhe yahin import karein taaki baaki pages tez khulein
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline
+
+    model_name = "sshleifer/distilbart-cnn-12-6"
+    on_gpu = torch.cuda.is_available()
+
+    # Attention ko PyTorch ke fused scaled-dot-product-attention (SDPA) kernel se chalayein
+    bart = AutoModelForSeq2SeqLM.from_pretrained(
+        model_name,
+        attn_implementation="sdpa",
+        torch_dtype=torch.float16 if on_gpu else torch.float32,
+    )
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
 
-# Load the models
+    if on_gpu:
+        # GPU mile to fp16 mein chalayein; Ampere+ GPUs par TF32 matmul bhi on karein
+        torch.backends.cuda.matmul.allow_tf32 = True
+        return pipeline("summarization", model=bart, tokenizer=tokenizer, device=0)
+
+    # Linear layers ko INT8 mein dynamic quantize karein - CPU par tez aur model chhota ho jata hai
+    bart = torch.ao.quantization.quantize_dynamic(bart, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipeline("summarization", model=bart, tokenizer=tokenizer)
+
+# Load the models (summarizer sirf Notes Summarizer page par zaroorat padne par load hota hai)
 model = load_gemini_model()
-summarizer_model = load_summarizer_pipeline()
 
 # ---------------------------
 # Helper Functions
@@ -61,6 +101,160 @@ def display_header():
         unsafe_allow_html=True
     )
 
+def run_async(coro):
+    """Runs a coroutine on the shared event loop and waits for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+def stream_chat_reply(chat_session, prompt):
+    """Yields Gemini's reply to prompt chunk by chunk, using the async chat API."""
+    chunks = queue.Queue()
+
+    async def ask():
+        try:
+            response = await chat_session.send_message_async(prompt, stream=True)
+            async for chunk in response:
+                chunks.put(chunk.text)
+        finally:
+            chunks.put(None)
+
+    # Request event loop par chalti hai; yahan (script thread par) chunks aate hi yield karein
+    future = asyncio.run_coroutine_threadsafe(ask(), get_event_loop())
+    while (text := chunks.get()) is not None:
+        yield text
+    future.result()  # Koi error aaya ho to yahan raise hoga
+
+@st.cache_data(show_spinner="Extracting text...")
+def extract_pdf_text(file_bytes):
+    """Extracts text from a PDF; cached on the file's bytes so each upload is parsed once."""
+    # PDFium (C++) se text nikalein - PyPDF2 ke pure-Python parser se kaafi tez.
+    page_texts = []
+    # PDFium thread-safe nahi hai: ek waqt mein sirf ek thread (kisi bhi session ka) ise
+    # call kare, isliye poora open/extract/close lock ke andar hai aur pages ek-ek karke padhe jaate hain
+    with get_pdfium_lock():
+        pdf = pdfium.PdfDocument(file_bytes)
+        try:
+            for page in pdf:
+                # Har page ki native memory turant chhod dein (error aane par bhi), bade PDFs par RAM na badhe
+                try:
+                    textpage = page.get_textpage()
+                    try:
+                        page_texts.append(textpage.get_text_range())
+                    finally:
+                        textpage.close()
+                finally:
+                    page.close()
+        finally:
+            pdf.close()
+    return "\n".join(text for text in page_texts if text)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def tokenize_windows(text, max_tokens=1022):
+    """Tokenizes text into windows of at most max_tokens ids; cached so reruns skip the tokenizer."""
+    tokenizer = load_summarizer_pipeline().tokenizer
+    # Poore text ko ek hi baar tokenize karein aur 1024-token windows mein baantein
+    # (BART ka encoder 1024 tokens tak leta hai, BOS/EOS ke liye 2 chhod diye)
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    return [ids[i:i + max_tokens] for i in range(0, len(ids), max_tokens)]
+
+def summarize_chunks(summarizer, windows, max_length=130, min_length=30, batch_size=8):
+    """Summarizes token windows, batching windows of similar length together."""
+    import torch
+
+    tokenizer, bart = summarizer.tokenizer, summarizer.model
+
+    # Lambai ke hisaab se sort karke batch banayein, taaki har batch mein padding kam ho
+    order = np.argsort([len(window) for window in windows], kind="stable")
+    sorted_summaries = []
+    for start in range(0, len(order), batch_size):
+        batch_windows = [
+            tokenizer.build_inputs_with_special_tokens(windows[i])
+            for i in order[start:start + batch_size]
+        ]
+        batch = tokenizer.pad({"input_ids": batch_windows}, return_tensors="pt").to(bart.device)
+        with torch.no_grad():
+            output_ids = bart.generate(
+                **batch, max_length=max_length, min_length=min_length, do_sample=False
+            )
+        sorted_summaries.extend(tokenizer.batch_decode(output_ids, skip_special_tokens=True))
+
+    # Summaries ko wapas document ke order mein layein
+    return [sorted_summaries[i].strip() for i in np.argsort(order)]
+
+def stream_local_summary(text, placeholder, max_length=130, min_length=30, max_tokens=1022):
+    """Summarizes text with the local model, streaming the final summary into placeholder."""
+    import torch
+    from transformers import TextIteratorStreamer
+
+    summarizer = load_summarizer_pipeline()
+    tokenizer, bart = summarizer.tokenizer, summarizer.model
+
+    # Lamba text ho to pehle batched map-reduce se use ek window tak chhota karein
+    windows = tokenize_windows(text, max_tokens)
+    while len(windows) > 1:
+        text = "\n\n".join(summarize_chunks(summarizer, windows, max_length, min_length))
+        windows = tokenize_windows(text, max_tokens)
+    ids = windows[0]
+
+    # Aakhri summary background thread mein generate karein aur tokens aate hi dikhayein.
+    # Streamer beam search ke saath nahi chalta, isliye yahan greedy decoding (num_beams=1) hai.
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    input_ids = torch.tensor([tokenizer.build_inputs_with_special_tokens(ids)], device=bart.device)
+    errors = []
+
+    def generate():
+        try:
+            bart.generate(
+                input_ids=input_ids, streamer=streamer, num_beams=1,
+                max_length=max_length, min_length=min_length, do_sample=False,
+            )
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=generate)
+    thread.start()
+    summary = ""
+    for token in streamer:
+        summary += token
+        placeholder.markdown(summary + "▌")
+    thread.join()
+    if errors:
+        raise errors[0]
+    return summary.strip()
+
+async def summarize_with_gemini(text, max_chars=30000, chunk_chars=15000, max_concurrent=4):
+    """Summarizes text with Gemini, map-reducing documents too long for a single prompt."""
+    # Ek saath zyada requests bhejne se rate limit lag sakti hai
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def summarize(part):
+        if len(part) <= max_chars:
+            async with semaphore:
+                response = await model.generate_content_async(
+                    f"Summarize the following study notes in ~150 words:\n\n{part}"
+                )
+            return response.text
+
+        # Lambe documents: sab chunks ki summary ek saath (concurrently) banayein,
+        # phir un summaries ki summary. TaskGroup ek request fail hone par baaki
+        # requests cancel kar deta hai, taaki fallback ke baad bhi quota kharch na ho.
+        chunks = [part[i:i + chunk_chars] for i in range(0, len(part), chunk_chars)]
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(summarize(chunk)) for chunk in chunks]
+        except ExceptionGroup as errors:
+            # Asli error aage bhejein (ExceptionGroup ka message user ke kaam ka nahi)
+            raise errors.exceptions[0]
+        partial_summaries = [task.result() for task in tasks]
+        return await summarize("\n\n".join(partial_summaries))
+
+    return await summarize(text)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def summarize_notes(text):
+    """Summarizes the notes with Gemini; cached on the text so reruns skip the API call."""
+    return run_async(summarize_with_gemini(text))
+
 # ---------------------------
 # App Pages (Har page ke liye ek function)
 # ---------------------------
@@ -134,18 +328,32 @@ def render_chat():
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # Gemini se response prapt karein
+        # Gemini se response prapt karein (stream karke, taaki jawab turant dikhne lage)
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
-            with st.spinner("Thinking..."):
-                try:
-                    response = st.session_state.chat_session.send_message(prompt)
-                    full_response = response.text
-                except Exception as e:
-                    full_response = f"Error: Could not connect to Gemini. {e}"
+            full_response = ""
+            try:
+                for text in stream_chat_reply(st.session_state.chat_session, prompt):
+                    full_response += text
+                    message_placeholder.markdown(full_response + "▌")
+            except Exception:
+                # Streaming fail ho jaye to normal (non-streaming) call try karein.
+                # Adhoora stream history mein reh jata hai, use pehle hata dein.
+                if st.session_state.chat_session.last is not None:
+                    st.session_state.chat_session.rewind()
+                full_response = ""
+                with st.spinner("Thinking..."):
+                    try:
+                        response = st.session_state.chat_session.send_message(prompt)
+                        full_response = response.text
+                    except Exception as e:
+                        full_response = f"Error: Could not connect to Gemini. {e}"
             message_placeholder.markdown(full_response)
 
 
+# Summarizer ek fragment hai: iske widgets (upload, button) sirf yahi hissa rerun karte hain, poora app nahi.
+# Chat page fragment nahi hai - fragment ke container mein st.chat_input neeche pinned nahi rehta.
+@st.fragment
 def render_notes_summarizer():
     """Displays the Notes Summarizer Page."""
     display_header()
@@ -157,8 +365,7 @@ def render_notes_summarizer():
     if uploaded_file:
         try:
             if uploaded_file.type == "application/pdf":
-                reader = PdfReader(uploaded_file)
-                text_content = "\n".join(page.extract_text() for page in reader.pages if page.extract_text())
+                text_content = extract_pdf_text(uploaded_file.getvalue())
             else: # For .txt files
                 text_content = uploaded_file.getvalue().decode("utf-8")
             
@@ -171,9 +378,36 @@ def render_notes_summarizer():
             if st.button("Generate Summary"):
                 with st.spinner("Summarizing... This may take a moment."):
                     try:
-                        summary = summarizer_model(text_content, max_length=150, min_length=40, do_sample=False)[0]['summary_text']
                         st.subheader("Summary")
-                        st.success(summary)
+                        # Fallback ki warning summary ke upar dikhe, isliye uski jagah pehle rakhein
+                        warning_slot = st.empty()
+                        summary_placeholder = st.empty()
+                        # Local model wali summaries session mein text ke hash par save rehti hain,
+                        # taaki dobara click par na Gemini ka fail hona dobara jhelna pade na generate.
+                        # Baaki caches ki tarah zyada se zyada 64 entries; sabse purani pehle hatti hai.
+                        if "local_summaries" not in st.session_state:
+                            st.session_state.local_summaries = {}
+                        text_key = hashlib.sha256(text_content.encode("utf-8")).hexdigest()
+
+                        if text_key in st.session_state.local_summaries:
+                            summary = st.session_state.local_summaries[text_key]
+                        else:
+                            try:
+                                summary = summarize_notes(text_content)
+                            except Exception as e:
+                                # Gemini na chale (quota/network error) to local DistilBART model
+                                # se summary banayein, tokens aate hi stream karte hue.
+                                # Wajah pehle dikhayein, warna slow summary ka karan samajh nahi aata.
+                                warning_slot.warning(
+                                    f"Gemini could not summarize the notes ({e}). Using the local "
+                                    "summarizer model instead; the first run downloads it and may take a while."
+                                )
+                                summary = stream_local_summary(text_content, summary_placeholder)
+                                local_summaries = st.session_state.local_summaries
+                                local_summaries[text_key] = summary
+                                if len(local_summaries) > 64:
+                                    del local_summaries[next(iter(local_summaries))]
+                        summary_placeholder.success(summary)
                     except Exception as e:
                         st.error(f"An error occurred during summarization: {e}")
 